@@ -6,11 +6,53 @@ load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 
-try:
-    client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URI)
+# Set by connect() at app startup
+client = None
+db = None
+
+async def connect() -> bool:
+    """Create the MongoDB client with a warm connection pool; returns whether MongoDB answered"""
+    global client, db
+    client = motor.motor_asyncio.AsyncIOMotorClient(
+        MONGO_URI,
+        maxPoolSize=100,
+        minPoolSize=10,
+        serverSelectionTimeoutMS=2000,
+        uuidRepresentation="standard"
+    )
     db = client["tradebot"]
-    print(f"Connected to MongoDB at {MONGO_URI}")
-except Exception as e:
-    print(f"Warning: Could not connect to MongoDB: {e}")
-    print("Database operations will be skipped")
-    db = None
\ No newline at end of file
+    try:
+        # Motor connects lazily, so ping to surface connection errors now
+        await client.admin.command("ping")
+        print(f"Connected to MongoDB at {MONGO_URI}")
+        return True
+    except Exception as e:
+        # Keep the client: it reconnects on its own once MongoDB is reachable
+        print(f"Warning: Could not reach MongoDB at startup: {e}")
+        print("Database operations will fail until it is reachable")
+        return False
+
+async def ensure_indexes():
+    """Create the indexes used by portfolio, order and alert queries (no-op if they exist)"""
+    if db is None:
+        return
+    indexes = [
+        (db.portfolio, [("user_id", 1), ("symbol", 1)], {"unique": True}),
+        (db.orders, [("user_id", 1), ("timestamp", -1)], {}),
+        (db.orders, [("status", 1), ("timestamp", 1)], {}),
+        (db.orders, [("user_id", 1), ("status", 1)], {}),
+        (db.user_alerts, [("user_id", 1), ("timestamp", -1)], {})
+    ]
+    for collection, keys, options in indexes:
+        try:
+            await collection.create_index(keys, **options)
+        except Exception as e:
+            print(f"Warning: Could not create index {keys} on {collection.name}: {e}")
+
+def close():
+    """Close the MongoDB client"""
+    global client, db
+    if client is not None:
+        client.close()
+    client = None
+    db = None
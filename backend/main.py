@@ -1,14 +1,51 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 import asyncio
+import os
+from curl_cffi import CurlOpt, requests as curl_requests
+import redis.asyncio as redis
+import database
 from routes import market, trades, users  # match your filenames
 from services.automation_service import automation_service
+from services.stock_service import stock_service
+from utils import clock, log
 
-app = FastAPI(title="TradeBot API")
+app = FastAPI(title="TradeBot API", default_response_class=ORJSONResponse)
 
 @app.on_event("startup")
 async def startup_event():
+    log.start()
+    if await database.connect():
+        await database.ensure_indexes()
+    # Keep one HTTP session (and its connection pool) for all yfinance calls.
+    # TCP keepalive stops idle pooled connections being dropped between requests,
+    # and the longer DNS cache avoids re-resolving Yahoo's hosts every minute
+    app.state.yf_session = curl_requests.Session(
+        impersonate="chrome",
+        curl_options={CurlOpt.TCP_KEEPALIVE: 1, CurlOpt.DNS_CACHE_TIMEOUT: 600}
+    )
+    stock_service.session = app.state.yf_session
+    # Share cached quotes and analytics between workers when Redis is configured
+    redis_url = os.getenv("REDIS_URL")
+    app.state.redis = redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5) if redis_url else None
+    stock_service.redis = app.state.redis
+    stock_service.order_writer.start()
+    stock_service.stock_writer.start()
     asyncio.create_task(automation_service.start())
+    asyncio.create_task(clock.tick())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await stock_service.order_writer.close()
+    await stock_service.stock_writer.close()
+    stock_service.session = None
+    app.state.yf_session.close()
+    stock_service.redis = None
+    if app.state.redis is not None:
+        await app.state.redis.aclose()
+    database.close()
+    log.stop()
 
 # Configure CORS to allow frontend requests
 app.add_middleware(
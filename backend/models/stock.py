@@ -1,8 +1,12 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from enum import Enum
 
+# Shared by every model: enums are stored as their plain values and
+# assignments are not re-validated
+_MODEL_CONFIG = ConfigDict(str_strip_whitespace=True, use_enum_values=True, validate_assignment=False)
+
 class OrderType(str, Enum):
     BUY = "buy"
     SELL = "sell"
@@ -14,6 +18,8 @@ class OrderStatus(str, Enum):
     FAILED = "failed"
 
 class StockData(BaseModel):
+    model_config = _MODEL_CONFIG
+
     symbol: str
     price: float
     volume: int
@@ -30,6 +36,8 @@ class StockData(BaseModel):
     timestamp: datetime
 
 class StockOrder(BaseModel):
+    model_config = _MODEL_CONFIG
+
     id: Optional[str] = None
     symbol: str
     order_type: OrderType
@@ -42,6 +50,8 @@ class StockOrder(BaseModel):
     notes: Optional[str] = None
 
 class Portfolio(BaseModel):
+    model_config = _MODEL_CONFIG
+
     user_id: str
     symbol: str
     quantity: int
@@ -52,6 +62,8 @@ class Portfolio(BaseModel):
     last_updated: datetime
 
 class StockAnalytics(BaseModel):
+    model_config = _MODEL_CONFIG
+
     symbol: str
     technical_indicators: Dict[str, Any]
     fundamental_metrics: Dict[str, Any]
@@ -61,6 +73,8 @@ class StockAnalytics(BaseModel):
     timestamp: datetime
 
 class ChatMessage(BaseModel):
+    model_config = _MODEL_CONFIG
+
     id: Optional[str] = None
     user_id: str
     message: str
@@ -69,6 +83,8 @@ class ChatMessage(BaseModel):
     context: Optional[Dict[str, Any]] = None
 
 class AutomatedPlan(BaseModel):
+    model_config = _MODEL_CONFIG
+
     id: Optional[str] = None
     user_id: str
     symbol: str
@@ -79,6 +95,8 @@ class AutomatedPlan(BaseModel):
     status: str = "active"
 
 class UserAlert(BaseModel):
+    model_config = _MODEL_CONFIG
+
     id: Optional[str] = None
     user_id: str
     symbol: str
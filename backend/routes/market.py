@@ -1,12 +1,14 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
 import yfinance as yf
-from database import db
-from datetime import datetime, timezone
+import hashlib
+import orjson
 from services.stock_service import stock_service
+from utils import clock
 from services.chatbot_service import chatbot_service
 from models.stock import StockOrder, OrderType, OrderStatus
 from typing import List
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter, ValidationError
 
 class ChatRequest(BaseModel):
     message: str
@@ -14,27 +16,67 @@ class ChatRequest(BaseModel):
 
 router = APIRouter(prefix="/market", tags=["Market"])
 
+# Validates raw order bodies straight from JSON bytes
+_ORDER_ADAPTER = TypeAdapter(StockOrder)
+
+def _order_body_schema() -> dict:
+    """StockOrder's JSON schema with its enum definitions inlined, for the OpenAPI request body"""
+    schema = StockOrder.model_json_schema()
+    definitions = schema.pop("$defs", {})
+    for field_schema in schema["properties"].values():
+        ref = field_schema.pop("$ref", None)
+        if ref is not None:
+            field_schema.update(definitions[ref.rsplit("/", 1)[-1]])
+    return schema
+
+# The handler reads the raw body itself, so describe it for /docs explicitly
+_ORDER_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": _order_body_schema()}}
+    }
+}
+
+def _orjson_default(obj):
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def _cached_json_response(request: Request, payload: dict, max_age: int) -> Response:
+    """Serialize a payload with an ETag and Cache-Control, answering 304 if the client copy is current"""
+    body = orjson.dumps(payload, default=_orjson_default)
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={max_age}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
 @router.get("/stock/{symbol}")
-async def get_stock_data(symbol: str):
+async def get_stock_data(symbol: str, request: Request):
     """Get comprehensive stock data for a symbol"""
     try:
         stock_data = await stock_service.get_stock_data(symbol)
-        return {"status": "success", "data": stock_data}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    return _cached_json_response(request, {"status": "success", "data": stock_data}, max_age=15)
 
 @router.get("/analytics/{symbol}")
-async def get_stock_analytics(symbol: str):
+async def get_stock_analytics(symbol: str, request: Request):
     """Get comprehensive stock analytics including technical indicators"""
     try:
         analytics = await stock_service.get_stock_analytics(symbol)
-        return {"status": "success", "data": analytics}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    return _cached_json_response(request, {"status": "success", "data": analytics}, max_age=300)
 
-@router.post("/order")
-async def place_order(order: StockOrder):
+@router.post("/order", openapi_extra=_ORDER_OPENAPI)
+async def place_order(request: Request):
     """Place a buy or sell order"""
+    try:
+        order = _ORDER_ADAPTER.validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in e.errors()])
+
     try:
         placed_order = await stock_service.place_order(order)
         return {"status": "success", "data": placed_order}
@@ -65,12 +107,8 @@ async def get_portfolio(user_id: str):
             total_value += item.current_value
             total_invested += item.total_invested
             
-            # Get current stock data for latest price
-            try:
-                stock_data = await stock_service.get_stock_data(item.symbol)
-                current_price = stock_data.price
-            except:
-                current_price = item.current_value / item.quantity if item.quantity > 0 else 0
+            # current_value was computed from the latest price by get_portfolio
+            current_price = item.current_value / item.quantity if item.quantity > 0 else 0
             
             profit_loss = item.current_value - item.total_invested
             profit_loss_percent = (profit_loss / item.total_invested * 100) if item.total_invested > 0 else 0
@@ -111,26 +149,29 @@ async def chat_with_bot(chat_request: ChatRequest):
                 "message": chat_request.message,
                 "response": response,
                 "user_id": chat_request.user_id,
-                "timestamp": datetime.now(timezone.utc).isoformat()
+                "timestamp": clock.now_iso()
             }
         }
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+# The help payload never changes, so serialize it once at import
+_HELP_BODY = orjson.dumps({
+    "status": "success",
+    "data": {
+        "help": chatbot_service.help_text,
+        "examples": [
+            "Buy 10 shares of AAPL",
+            "Sell 5 MSFT",
+            "What is the price of TSLA?",
+            "Analyze GOOGL",
+            "Show my portfolio",
+            "Help"
+        ]
+    }
+})
+
 @router.get("/chat/help")
 async def get_chat_help():
     """Get help information for the chatbot"""
-    return {
-        "status": "success",
-        "data": {
-            "help": chatbot_service.help_text,
-            "examples": [
-                "Buy 10 shares of AAPL",
-                "Sell 5 MSFT",
-                "What is the price of TSLA?",
-                "Analyze GOOGL",
-                "Show my portfolio",
-                "Help"
-            ]
-        }
-    }
+    return Response(_HELP_BODY, media_type="application/json")
@@ -0,0 +1,16 @@
+import os
+import uvicorn
+
+if __name__ == "__main__":
+    # uvloop/httptools event loop and parser, one worker per CPU unless
+    # WEB_CONCURRENCY says otherwise
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", 8000)),
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)),
+        limit_concurrency=1000,
+        timeout_keep_alive=30
+    )
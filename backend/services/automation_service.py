@@ -1,6 +1,6 @@
 import asyncio
 from datetime import datetime, timezone, timedelta
-from database import db
+import database
 from services.stock_service import stock_service
 from models.stock import StockOrder, OrderType, OrderStatus, UserAlert
 from bson import ObjectId
@@ -29,14 +29,22 @@ class AutomationService:
     def stop(self):
         self.is_running = False
 
+    async def _claim(self, plan_doc: dict, field: str, now: datetime) -> bool:
+        """Stamp a plan field with now unless another worker already changed it"""
+        result = await database.db.automated_plans.update_one(
+            {"_id": plan_doc["_id"], field: plan_doc.get(field)},
+            {"$set": {field: now}}
+        )
+        return result.modified_count == 1
+
     async def process_all_plans(self):
         """Iterate over all active automated plans and execute logic"""
-        if db is None:
+        if database.db is None:
             return
             
         now = datetime.now(timezone.utc)
         
-        cursor = db.automated_plans.find({"status": "active"})
+        cursor = database.db.automated_plans.find({"status": "active"})
         plans = await cursor.to_list(length=None)
         
         for plan_doc in plans:
@@ -58,7 +66,9 @@ class AutomationService:
                 
                 # 1. Execute Daily Order
                 # We do this if 'last_executed' is None, or it was > 24 hours ago
-                if last_executed is None or (now - last_executed).total_seconds() > 86400:
+                order_due = last_executed is None or (now - last_executed).total_seconds() > 86400
+                # Claiming the run first means only one worker process places the order
+                if order_due and await self._claim(plan_doc, "last_executed", now):
                     print(f"Executing daily plan for {user_id}: Buying {quantity} {symbol}")
                     order = StockOrder(
                         symbol=symbol.upper(),
@@ -70,18 +80,21 @@ class AutomationService:
                         notes="Automated Daily Order"
                     )
                     order.status = OrderStatus.EXECUTED
-                    placed_order = await stock_service.place_order(order)
-                    
-                    # Update plan
-                    await db.automated_plans.update_one(
-                        {"_id": plan_doc["_id"]},
-                        {"$set": {"last_executed": now}}
-                    )
+                    try:
+                        placed_order = await stock_service.place_order(order)
+                    except Exception:
+                        # Release the claim so the next cycle retries
+                        await database.db.automated_plans.update_one(
+                            {"_id": plan_doc["_id"]},
+                            {"$set": {"last_executed": plan_doc.get("last_executed")}}
+                        )
+                        raise
                 
                 # 2. Check for drop alerts
                 # If change percent is lower than -2%, and we haven't alerted in the last 12 hours
                 if stock_data.change_percent < -2.0:
-                    if last_alert is None or (now - last_alert).total_seconds() > 43200: # 12 hours
+                    alert_due = last_alert is None or (now - last_alert).total_seconds() > 43200 # 12 hours
+                    if alert_due and await self._claim(plan_doc, "last_alert_time", now):
                         print(f"Sending low price alert for {symbol} to {user_id}")
                         alert = UserAlert(
                             user_id=user_id,
@@ -89,12 +102,7 @@ class AutomationService:
                             message=f"🔔 Alert: {symbol} has dropped by {stock_data.change_percent:.2f}%. Current price is ${stock_data.price:.2f}. This might be a good time to buy more, or review your automated plan.",
                             timestamp=now
                         )
-                        await db.user_alerts.insert_one(alert.dict())
-                        
-                        await db.automated_plans.update_one(
-                            {"_id": plan_doc["_id"]},
-                            {"$set": {"last_alert_time": now}}
-                        )
+                        await database.db.user_alerts.insert_one(alert.model_dump())
                         
             except Exception as e:
                 print(f"Error processing plan for {plan_doc.get('symbol')}: {e}")
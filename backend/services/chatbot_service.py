@@ -1,12 +1,174 @@
 import re
 from typing import Dict, List, Optional, Tuple
+from enum import IntEnum
 from datetime import datetime, timezone
 from models.stock import StockOrder, OrderType, OrderStatus, AutomatedPlan
 from services.stock_service import stock_service
-from database import db
+import database
 import asyncio
 
+class Intent(IntEnum):
+    BUY = 1
+    SELL = 2
+    AUTOMATE = 3
+    BEST_STOCK = 4
+    PRICE = 5
+    ANALYTICS = 6
+    PORTFOLIO = 7
+    ORDERS = 8
+    ALERTS = 9
+    HELP = 10
+    GREETING = 11
+
+# Quantity/symbol extraction patterns for each trade action, compiled once
+_QUANTITY_SYMBOL_PATTERNS = {
+    action: tuple(re.compile(pattern) for pattern in (
+        rf'{action}\s+(\d+)\s+shares?\s+of\s+([A-Za-z]+)',
+        rf'{action}\s+([A-Za-z]+)\s+(\d+)\s+shares?',
+        rf'{action}\s+(\d+)\s+([A-Za-z]+)',
+        rf'{action}\s+([A-Za-z]+)\s+at\s+market'
+    ))
+    for action in ('buy', 'sell')
+}
+
+# Symbol extraction patterns, compiled once
+_OF_RE = re.compile(r'(?:of|for)\s+([A-Za-z]{3,5})', re.IGNORECASE)
+_QUOTED_RE = re.compile(r'"([A-Za-z]{3,5})"')
+_SYMBOL_RE = re.compile(r'\b([A-Z]{3,5})\b')
+
+# Common words that aren't stock symbols
+_STOPWORDS = frozenset({'THE', 'AND', 'FOR', 'ARE', 'YOU', 'CAN', 'GET', 'BUY', 'SELL', 'SHOW', 'WHAT', 'WHEN', 'WHERE', 'WHY', 'HOW'})
+
+_GREETING_RESPONSE = "Hello! I'm StockBot, your AI trading assistant. I can help you buy/sell stocks, get market data, and analyze investments. Type 'help' to see all commands!"
+
+_ORDERS_RESPONSE = """
+📋 **Order History**
+
+This feature is coming soon! I'll be able to show you:
+• Pending orders
+• Executed trades
+• Order status updates
+• Trade history
+
+For now, you can place new orders using commands like:
+• "Buy 10 shares of AAPL"
+• "Sell 5 MSFT"
+""".strip()
+
+def _format_ratio(value: Optional[float]) -> str:
+    """Format an optional fundamental ratio, N/A when yfinance has no value"""
+    return f"{value:.2f}" if value is not None else "N/A"
+
+_DEFAULT_RESPONSE = "I didn't understand that command. Try saying 'help' to see what I can do, or ask me to buy/sell stocks, get prices, or analyze investments."
+
+# Response templates, parsed once and filled with str.format_map per request
+_BUY_TEMPLATE = """
+🛑 **Order Not Placed automatically**
+
+I've analyzed your request to buy {quantity} shares of {symbol}:
+
+{analysis}{suggestion}
+
+If you still want to proceed with buying {symbol}, please use the trading interface to manually confirm your order.
+""".strip()
+
+_BEST_STOCK_TEMPLATE = """
+📈 **Market Recommendations Based on Real-Time Data**
+
+✅ **Best Stock to Buy:** **{best_symbol}**
+• **Current Price:** ${best_price:.2f}
+• **Risk Score:** 🟢 Low ({best_risk}/100)
+• **Analysis:** {best_reason}
+
+❌ **Stock to Avoid Right Now:** **{worst_symbol}**
+• **Risk Score:** 🔴 High ({worst_risk}/100)
+• **Analysis:** {worst_reason}
+
+*Note: This is based on technical and fundamental indicators. Always do your own research before investing.*
+""".strip()
+
+_SELL_TEMPLATE = """
+✅ **Sell Order Executed Successfully!**
+
+**Stock:** {symbol}
+**Quantity:** {quantity} shares
+**Price:** ${price:.2f}
+**Total Amount:** ${total:.2f}
+**Order ID:** {order_id}
+
+Your order has been executed and portfolio updated!
+""".strip()
+
+_PRICE_TEMPLATE = """
+{change_emoji} **{symbol} Stock Price**
+
+**Current Price:** ${price:.2f}
+**Change:** {change_color} ${change:.2f} ({change_percent:.2f}%)
+**Volume:** {volume:,}
+**Market Cap:** ${market_cap_b:.2f}B (if available)
+**P/E Ratio:** {pe_ratio} (if available)
+
+**Trading Range:**
+• Open: ${open_price:.2f}
+• High: ${high_price:.2f}
+• Low: ${low_price:.2f}
+""".strip()
+
+_ANALYTICS_TEMPLATE = """
+📊 **{symbol} Analytics Report**
+
+**Risk Score:** {risk_level} ({risk_score}/100)
+
+**Technical Indicators:**
+• RSI: {rsi:.2f}
+• MACD: {macd:.2f}
+• 20-day SMA: ${sma_20:.2f}
+• 50-day SMA: ${sma_50:.2f}
+
+**Fundamental Metrics:**
+• P/E Ratio: {pe_ratio}
+• Market Cap: ${market_cap_b:.2f}B (if available)
+• Debt/Equity: {debt_to_equity}
+
+**Recommendations:**
+{recommendations}
+**Last Updated:** {updated}
+""".strip()
+
+_PORTFOLIO_TEMPLATE = """
+💼 **Portfolio Summary**
+
+**Total Positions:** {count}
+**Total Invested:** ${total_invested:.2f}
+**Current Value:** ${total_current:.2f}
+**Unrealized P&L:** {pnl_emoji} ${total_pnl:.2f} ({overall_return:.2f}%)
+
+**Positions:**
+{positions}""".strip()
+
+_POSITION_TEMPLATE = """
+**{symbol}:**
+• Quantity: {quantity} shares
+• Avg Price: ${average_price:.2f}
+• Current Value: ${current_value:.2f}
+• P&L: {pnl_emoji} ${unrealized_pnl:.2f}"""
+
+_AUTOMATE_TEMPLATE = """
+🤖 **Automated Trading Plan Activated!**
+
+**Stock:** {symbol}
+**Quantity:** {quantity} shares
+**Frequency:** Daily
+
+I will execute a buy order for {quantity} shares of {symbol} every day. I will also monitor {symbol} and alert you if the price drops by 2% or more.
+""".strip()
+
 class StockChatbotService:
+    _HELP_WORDS = ('help', 'commands', 'what can you do')
+    _GREETING_WORDS = ('hello', 'hi', 'hey', 'start')
+    _SELL_KEYWORDS = ('sell', 'sell off', 'liquidate', 'exit position')
+    _NEGATION_PHRASES = ('what if', 'what would', 'how much', 'when')
+
     def __init__(self):
         self.command_patterns = {
             'buy_stock': [
@@ -93,128 +255,78 @@ class StockChatbotService:
 • "Show my alerts"
         """
 
+        # Each intent's patterns OR'd into one pattern, compiled once
+        self._compiled = {
+            intent: re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE)
+            for intent, patterns in self.command_patterns.items()
+        }
+
+        # Every intent pattern plus the keyword fallbacks used by the sell and
+        # automate checks, so one scan can reject messages that match nothing
+        prefilter = [p for patterns in self.command_patterns.values() for p in patterns]
+        prefilter += [re.escape(k) for k in self._SELL_KEYWORDS]
+        prefilter.append('automate')
+        self._intent_prefilter = re.compile("|".join(f"(?:{p})" for p in prefilter), re.IGNORECASE)
+
+        # Pattern-matched intents in the order they take priority
+        self._intent_patterns = [
+            (Intent.BUY, self._compiled['buy_stock']),
+            (Intent.SELL, self._compiled['sell_stock']),
+            (Intent.AUTOMATE, self._compiled['automate_stock']),
+            (Intent.BEST_STOCK, self._compiled['best_stock']),
+            (Intent.PRICE, self._compiled['get_price']),
+            (Intent.ANALYTICS, self._compiled['get_analytics']),
+            (Intent.PORTFOLIO, self._compiled['get_portfolio']),
+            (Intent.ORDERS, self._compiled['get_orders']),
+            (Intent.ALERTS, self._compiled['get_alerts'])
+        ]
+
     async def process_message(self, message: str, user_id: str = "default_user") -> str:
         """Process natural language message and return appropriate response"""
         try:
             message = message.strip().lower()
             
-            # Check for help command
-            if any(word in message for word in ['help', 'commands', 'what can you do']):
-                return self.help_text
+            intent = self._classify(message)
+            if intent is None:
+                return _DEFAULT_RESPONSE
             
-            # Check for greeting
-            if any(word in message for word in ['hello', 'hi', 'hey', 'start']):
-                return "Hello! I'm StockBot, your AI trading assistant. I can help you buy/sell stocks, get market data, and analyze investments. Type 'help' to see all commands!"
-            
-            # Process trading commands
-            if await self._is_buy_command(message):
-                return await self._handle_buy_command(message, user_id)
-            
-            if await self._is_sell_command(message):
-                return await self._handle_sell_command(message, user_id)
-            
-            if await self._is_automate_command(message):
-                return await self._handle_automate_command(message, user_id)
-                
-            # Process information commands
-            if await self._is_best_stock_query(message):
-                return await self._handle_best_stock_query()
-                
-            if await self._is_price_query(message):
-                return await self._handle_price_query(message)
-            
-            if await self._is_analytics_query(message):
-                return await self._handle_analytics_query(message)
-            
-            if await self._is_portfolio_query(message):
-                return await self._handle_portfolio_query(user_id)
-            
-            if await self._is_orders_query(message):
-                return await self._handle_orders_query(user_id)
-                
-            if await self._is_alerts_query(message):
-                return await self._handle_alerts_query(user_id)
-            
-            # Default response
-            return "I didn't understand that command. Try saying 'help' to see what I can do, or ask me to buy/sell stocks, get prices, or analyze investments."
+            return await self._HANDLERS[intent](self, message, user_id)
             
         except Exception as e:
             return f"Sorry, I encountered an error: {str(e)}. Please try again."
 
-    async def _is_buy_command(self, message: str) -> bool:
-        """Check if message is a buy command"""
-        for pattern in self.command_patterns['buy_stock']:
-            if re.search(pattern, message):
-                return True
-        return False
-
-    async def _is_sell_command(self, message: str) -> bool:
-        """Check if message is a sell command"""
-        # Check for explicit sell patterns
-        for pattern in self.command_patterns['sell_stock']:
-            if re.search(pattern, message):
-                return True
+    def _classify(self, message: str) -> Optional[Intent]:
+        """Return the first intent the message matches, in priority order"""
+        if any(word in message for word in self._HELP_WORDS):
+            return Intent.HELP
+        
+        if any(word in message for word in self._GREETING_WORDS):
+            return Intent.GREETING
         
-        # Check for sell-related keywords
-        sell_keywords = ['sell', 'sell off', 'liquidate', 'exit position']
-        if any(keyword in message.lower() for keyword in sell_keywords):
-            # Make sure it's not asking about selling (like "what if I sell")
-            if not any(word in message.lower() for word in ['what if', 'what would', 'how much', 'when']):
-                return True
+        if not self._intent_prefilter.search(message):
+            return None
         
-        return False
-
-    async def _is_price_query(self, message: str) -> bool:
-        """Check if message is asking for price"""
-        for pattern in self.command_patterns['get_price']:
-            if re.search(pattern, message):
-                return True
-        return False
-
-    async def _is_analytics_query(self, message: str) -> bool:
-        """Check if message is asking for analytics"""
-        for pattern in self.command_patterns['get_analytics']:
-            if re.search(pattern, message):
-                return True
-        return False
-
-    async def _is_portfolio_query(self, message: str) -> bool:
-        """Check if message is asking for portfolio"""
-        for pattern in self.command_patterns['get_portfolio']:
-            if re.search(pattern, message):
-                return True
-        return False
-
-    async def _is_orders_query(self, message: str) -> bool:
-        """Check if message is asking for orders"""
-        for pattern in self.command_patterns['get_orders']:
-            if re.search(pattern, message):
-                return True
-        return False
-
-    async def _is_automate_command(self, message: str) -> bool:
-        """Check if message is an automate command"""
-        for pattern in self.command_patterns['automate_stock']:
-            if re.search(pattern, message):
-                return True
-        # Additional keyword check
-        if 'automate' in message and 'buy' in message:
-            return True
-        return False
-
-    async def _is_alerts_query(self, message: str) -> bool:
-        """Check if message is asking for alerts"""
-        for pattern in self.command_patterns['get_alerts']:
-            if re.search(pattern, message):
-                return True
-        return False
+        for intent, pattern in self._intent_patterns:
+            if pattern.search(message):
+                return intent
+            
+            # Sell-related keywords, unless it's asking about selling (like "what if I sell")
+            if intent == Intent.SELL and any(keyword in message for keyword in self._SELL_KEYWORDS):
+                if not any(word in message for word in self._NEGATION_PHRASES):
+                    return intent
+            
+            if intent == Intent.AUTOMATE and 'automate' in message and 'buy' in message:
+                return intent
         
-    async def _is_best_stock_query(self, message: str) -> bool:
-        """Check if message is asking for best stock recommendations"""
-        for pattern in self.command_patterns['best_stock']:
-            if re.search(pattern, message):
-                return True
-        return False
+        return None
+
+    async def _handle_help(self, message: str, user_id: str) -> str:
+        """Handle help requests"""
+        return self.help_text
+
+    async def _handle_greeting(self, message: str, user_id: str) -> str:
+        """Handle greetings"""
+        return _GREETING_RESPONSE
 
     async def _handle_buy_command(self, message: str, user_id: str) -> str:
         """Handle buy stock commands"""
@@ -243,21 +355,17 @@ class StockChatbotService:
             except Exception:
                 suggestion_msg = ""
             
-            return f"""
-🛑 **Order Not Placed automatically**
-
-I've analyzed your request to buy {quantity} shares of {symbol.upper()}:
-
-{analysis_msg}{suggestion_msg}
-
-If you still want to proceed with buying {symbol.upper()}, please use the trading interface to manually confirm your order.
-""".strip()
-
+            return _BUY_TEMPLATE.format_map({
+                'quantity': quantity,
+                'symbol': symbol.upper(),
+                'analysis': analysis_msg,
+                'suggestion': suggestion_msg
+            })
             
         except Exception as e:
             return f"❌ Failed to process buy command: {str(e)}"
 
-    async def _handle_best_stock_query(self) -> str:
+    async def _handle_best_stock_query(self, message: str, user_id: str) -> str:
         """Handle request for the best stock to buy right now"""
         try:
             # We already have a function that finds the best stock based on lowest risk score
@@ -289,21 +397,15 @@ If you still want to proceed with buying {symbol.upper()}, please use the tradin
             else:
                 worst_reason = worst_analytics.recommendations[0] if worst_analytics.recommendations else "High risk based on current indicators."
 
-            response = f"""
-📈 **Market Recommendations Based on Real-Time Data**
-
-✅ **Best Stock to Buy:** **{best_opportunity['symbol']}**
-• **Current Price:** ${best_opportunity['price']:.2f}
-• **Risk Score:** 🟢 Low ({best_opportunity['risk_score']}/100)
-• **Analysis:** {best_opportunity['recommendation']}
-
-❌ **Stock to Avoid Right Now:** **{worst_stock}**
-• **Risk Score:** 🔴 High ({highest_risk}/100)
-• **Analysis:** {worst_reason}
-
-*Note: This is based on technical and fundamental indicators. Always do your own research before investing.*
-""".strip()
-            return response
+            return _BEST_STOCK_TEMPLATE.format_map({
+                'best_symbol': best_opportunity['symbol'],
+                'best_price': best_opportunity['price'],
+                'best_risk': best_opportunity['risk_score'],
+                'best_reason': best_opportunity['recommendation'],
+                'worst_symbol': worst_stock,
+                'worst_risk': highest_risk,
+                'worst_reason': worst_reason
+            })
         except Exception as e:
             return f"❌ Failed to get stock recommendations: {str(e)}"
 
@@ -336,22 +438,18 @@ If you still want to proceed with buying {symbol.upper()}, please use the tradin
             # Place order (which will update portfolio since status is EXECUTED)
             placed_order = await stock_service.place_order(order)
             
-            return f"""
-✅ **Sell Order Executed Successfully!**
-
-**Stock:** {symbol.upper()}
-**Quantity:** {quantity} shares
-**Price:** ${stock_data.price:.2f}
-**Total Amount:** ${placed_order.total_amount:.2f}
-**Order ID:** {placed_order.id}
-
-Your order has been executed and portfolio updated!
-            """.strip()
+            return _SELL_TEMPLATE.format_map({
+                'symbol': symbol.upper(),
+                'quantity': quantity,
+                'price': stock_data.price,
+                'total': placed_order.total_amount,
+                'order_id': placed_order.id
+            })
             
         except Exception as e:
             return f"❌ Failed to place sell order: {str(e)}"
 
-    async def _handle_price_query(self, message: str) -> str:
+    async def _handle_price_query(self, message: str, user_id: str) -> str:
         """Handle price queries"""
         try:
             # Extract symbol
@@ -367,25 +465,25 @@ Your order has been executed and portfolio updated!
             change_emoji = "📈" if stock_data.change >= 0 else "📉"
             change_color = "🟢" if stock_data.change >= 0 else "🔴"
             
-            return f"""
-{change_emoji} **{symbol.upper()} Stock Price**
-
-**Current Price:** ${stock_data.price:.2f}
-**Change:** {change_color} ${stock_data.change:.2f} ({stock_data.change_percent:.2f}%)
-**Volume:** {stock_data.volume:,}
-**Market Cap:** ${stock_data.market_cap/1e9:.2f}B (if available)
-**P/E Ratio:** {stock_data.pe_ratio:.2f} (if available)
-
-**Trading Range:**
-• Open: ${stock_data.open_price:.2f}
-• High: ${stock_data.high_price:.2f}
-• Low: ${stock_data.low_price:.2f}
-            """.strip()
+            return _PRICE_TEMPLATE.format_map({
+                'change_emoji': change_emoji,
+                'change_color': change_color,
+                'symbol': symbol.upper(),
+                'price': stock_data.price,
+                'change': stock_data.change,
+                'change_percent': stock_data.change_percent,
+                'volume': stock_data.volume,
+                'market_cap_b': (stock_data.market_cap or 0) / 1e9,
+                'pe_ratio': _format_ratio(stock_data.pe_ratio),
+                'open_price': stock_data.open_price,
+                'high_price': stock_data.high_price,
+                'low_price': stock_data.low_price
+            })
             
         except Exception as e:
             return f"❌ Failed to get price: {str(e)}"
 
-    async def _handle_analytics_query(self, message: str) -> str:
+    async def _handle_analytics_query(self, message: str, user_id: str) -> str:
         """Handle analytics queries"""
         try:
             # Extract symbol
@@ -400,36 +498,29 @@ Your order has been executed and portfolio updated!
             # Format response
             risk_level = "🟢 Low" if analytics.risk_score < 30 else "🟡 Medium" if analytics.risk_score < 70 else "🔴 High"
             
-            response = f"""
-📊 **{symbol.upper()} Analytics Report**
-
-**Risk Score:** {risk_level} ({analytics.risk_score}/100)
-
-**Technical Indicators:**
-• RSI: {analytics.technical_indicators.get('rsi', 0):.2f}
-• MACD: {analytics.technical_indicators.get('macd', 0):.2f}
-• 20-day SMA: ${analytics.technical_indicators.get('sma_20', 0):.2f}
-• 50-day SMA: ${analytics.technical_indicators.get('sma_50', 0):.2f}
-
-**Fundamental Metrics:**
-• P/E Ratio: {analytics.fundamental_metrics.get('pe_ratio', 'N/A')}
-• Market Cap: ${analytics.fundamental_metrics.get('market_cap', 0)/1e9:.2f}B (if available)
-• Debt/Equity: {analytics.fundamental_metrics.get('debt_to_equity', 'N/A')}
-
-**Recommendations:**
-"""
-            
-            for rec in analytics.recommendations:
-                response += f"• {rec}\n"
-            
-            response += f"\n**Last Updated:** {analytics.timestamp.strftime('%Y-%m-%d %H:%M:%S')}"
-            
-            return response.strip()
+            technical = analytics.technical_indicators
+            fundamental = analytics.fundamental_metrics
+            market_cap = fundamental.get('market_cap') or 0
+            
+            return _ANALYTICS_TEMPLATE.format_map({
+                'symbol': symbol.upper(),
+                'risk_level': risk_level,
+                'risk_score': analytics.risk_score,
+                'rsi': technical.get('rsi', 0),
+                'macd': technical.get('macd', 0),
+                'sma_20': technical.get('sma_20', 0),
+                'sma_50': technical.get('sma_50', 0),
+                'pe_ratio': _format_ratio(fundamental.get('pe_ratio')),
+                'market_cap_b': market_cap / 1e9,
+                'debt_to_equity': _format_ratio(fundamental.get('debt_to_equity')),
+                'recommendations': "".join(f"• {rec}\n" for rec in analytics.recommendations),
+                'updated': analytics.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+            })
             
         except Exception as e:
             return f"❌ Failed to get analytics: {str(e)}"
 
-    async def _handle_portfolio_query(self, user_id: str) -> str:
+    async def _handle_portfolio_query(self, message: str, user_id: str) -> str:
         """Handle portfolio queries"""
         try:
             # Get portfolio
@@ -444,50 +535,37 @@ Your order has been executed and portfolio updated!
             total_pnl = sum(p.unrealized_pnl for p in portfolios)
             overall_return = (total_pnl / total_invested * 100) if total_invested > 0 else 0
             
-            response = f"""
-💼 **Portfolio Summary**
-
-**Total Positions:** {len(portfolios)}
-**Total Invested:** ${total_invested:.2f}
-**Current Value:** ${total_current:.2f}
-**Unrealized P&L:** {'🟢' if total_pnl >= 0 else '🔴'} ${total_pnl:.2f} ({overall_return:.2f}%)
-
-**Positions:**
-"""
-            
-            for portfolio in portfolios:
-                pnl_emoji = "🟢" if portfolio.unrealized_pnl >= 0 else "🔴"
-                response += f"""
-**{portfolio.symbol}:**
-• Quantity: {portfolio.quantity} shares
-• Avg Price: ${portfolio.average_price:.2f}
-• Current Value: ${portfolio.current_value:.2f}
-• P&L: {pnl_emoji} ${portfolio.unrealized_pnl:.2f}
-"""
+            positions = "\n".join(
+                _POSITION_TEMPLATE.format_map({
+                    'symbol': portfolio.symbol,
+                    'quantity': portfolio.quantity,
+                    'average_price': portfolio.average_price,
+                    'current_value': portfolio.current_value,
+                    'pnl_emoji': "🟢" if portfolio.unrealized_pnl >= 0 else "🔴",
+                    'unrealized_pnl': portfolio.unrealized_pnl
+                })
+                for portfolio in portfolios
+            )
             
-            return response.strip()
+            return _PORTFOLIO_TEMPLATE.format_map({
+                'count': len(portfolios),
+                'total_invested': total_invested,
+                'total_current': total_current,
+                'pnl_emoji': '🟢' if total_pnl >= 0 else '🔴',
+                'total_pnl': total_pnl,
+                'overall_return': overall_return,
+                'positions': positions
+            })
             
         except Exception as e:
             return f"❌ Failed to get portfolio: {str(e)}"
 
-    async def _handle_orders_query(self, user_id: str) -> str:
+    async def _handle_orders_query(self, message: str, user_id: str) -> str:
         """Handle orders queries"""
         try:
             # This would require additional database queries for orders
             # For now, return a placeholder
-            return """
-📋 **Order History**
-
-This feature is coming soon! I'll be able to show you:
-• Pending orders
-• Executed trades
-• Order status updates
-• Trade history
-
-For now, you can place new orders using commands like:
-• "Buy 10 shares of AAPL"
-• "Sell 5 MSFT"
-            """.strip()
+            return _ORDERS_RESPONSE
             
         except Exception as e:
             return f"❌ Failed to get orders: {str(e)}"
@@ -515,27 +593,19 @@ For now, you can place new orders using commands like:
                 created_at=datetime.now(timezone.utc)
             )
             
-            result = await db.automated_plans.insert_one(plan.dict())
+            result = await database.db.automated_plans.insert_one(plan.model_dump())
             
-            return f"""
-🤖 **Automated Trading Plan Activated!**
-
-**Stock:** {symbol}
-**Quantity:** {quantity} shares
-**Frequency:** Daily
-
-I will execute a buy order for {quantity} shares of {symbol} every day. I will also monitor {symbol} and alert you if the price drops by 2% or more.
-""".strip()
+            return _AUTOMATE_TEMPLATE.format_map({'symbol': symbol, 'quantity': quantity})
         except Exception as e:
             return f"❌ Failed to setup automation: {str(e)}"
 
-    async def _handle_alerts_query(self, user_id: str) -> str:
+    async def _handle_alerts_query(self, message: str, user_id: str) -> str:
         """Handle alerts query"""
         try:
-            if db is None:
+            if database.db is None:
                 return "Database not available"
                 
-            cursor = db.user_alerts.find({"user_id": user_id}).sort("timestamp", -1).limit(5)
+            cursor = database.db.user_alerts.find({"user_id": user_id}).sort("timestamp", -1).limit(5)
             alerts = await cursor.to_list(length=5)
             
             if not alerts:
@@ -558,15 +628,8 @@ I will execute a buy order for {quantity} shares of {symbol} every day. I will a
         """Extract quantity and symbol from buy/sell commands"""
         try:
             # Try different patterns
-            patterns = [
-                rf'{action}\s+(\d+)\s+shares?\s+of\s+([A-Za-z]+)',
-                rf'{action}\s+([A-Za-z]+)\s+(\d+)\s+shares?',
-                rf'{action}\s+(\d+)\s+([A-Za-z]+)',
-                rf'{action}\s+([A-Za-z]+)\s+at\s+market'
-            ]
-            
-            for pattern in patterns:
-                match = re.search(pattern, message)
+            for pattern in _QUANTITY_SYMBOL_PATTERNS[action]:
+                match = pattern.search(message)
                 if match:
                     if 'at market' in message:
                         # For market orders, assume 1 share if quantity not specified
@@ -589,32 +652,41 @@ I will execute a buy order for {quantity} shares of {symbol} every day. I will a
         """Extract stock symbol from message"""
         try:
             # Look for symbols after "of" or "for" (most common pattern)
-            of_pattern = r'(?:of|for)\s+([A-Za-z]{3,5})'
-            match = re.search(of_pattern, message, re.IGNORECASE)
+            match = _OF_RE.search(message)
             if match:
                 return match.group(1).upper()
             
             # Look for symbols in quotes
-            quoted_pattern = r'"([A-Za-z]{3,5})"'
-            match = re.search(quoted_pattern, message)
+            match = _QUOTED_RE.search(message)
             if match:
                 return match.group(1).upper()
             
             # Look for common stock symbols (3-5 letters) at word boundaries
-            symbol_pattern = r'\b([A-Z]{3,5})\b'
-            matches = re.findall(symbol_pattern, message.upper())
-            
-            if matches:
-                # Filter out common words that aren't stock symbols
-                common_words = {'THE', 'AND', 'FOR', 'ARE', 'YOU', 'CAN', 'GET', 'BUY', 'SELL', 'SHOW', 'WHAT', 'WHEN', 'WHERE', 'WHY', 'HOW'}
-                valid_symbols = [s for s in matches if s not in common_words]
-                if valid_symbols:
-                    return valid_symbols[0]
+            # skipping common words that aren't stock symbols
+            for match in _SYMBOL_RE.finditer(message.upper()):
+                symbol = match.group(1)
+                if symbol not in _STOPWORDS:
+                    return symbol
             
             return None
             
         except Exception:
             return None
 
+    # Intent -> handler dispatch table; every handler takes (message, user_id)
+    _HANDLERS = {
+        Intent.BUY: _handle_buy_command,
+        Intent.SELL: _handle_sell_command,
+        Intent.AUTOMATE: _handle_automate_command,
+        Intent.BEST_STOCK: _handle_best_stock_query,
+        Intent.PRICE: _handle_price_query,
+        Intent.ANALYTICS: _handle_analytics_query,
+        Intent.PORTFOLIO: _handle_portfolio_query,
+        Intent.ORDERS: _handle_orders_query,
+        Intent.ALERTS: _handle_alerts_query,
+        Intent.HELP: _handle_help,
+        Intent.GREETING: _handle_greeting
+    }
+
 # Global instance
 chatbot_service = StockChatbotService()
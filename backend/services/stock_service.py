@@ -4,13 +4,212 @@ import numpy as np
 from datetime import datetime, timezone, timedelta
 from typing import Dict, List, Optional, Tuple
 from models.stock import StockData, StockOrder, Portfolio, StockAnalytics, OrderType, OrderStatus
-from database import db
+import database
+from utils.write_behind import WriteBehindQueue
+from utils.ttl_cache import TTLCache
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import asyncio
+import logging
+
+logger = logging.getLogger("stock_service")
+
+# yfinance is blocking, so its requests run here instead of on the event loop
+_YF_POOL = ThreadPoolExecutor(max_workers=16, thread_name_prefix="yfinance")
+
+# Ticker.info keys read for analytics, and the fundamental metric each becomes
+_INFO_FIELDS = (
+    "marketCap", "trailingPE", "priceToBook", "debtToEquity",
+    "returnOnEquity", "profitMargins", "revenueGrowth", "earningsGrowth"
+)
+_METRIC_NAMES = (
+    "market_cap", "pe_ratio", "pb_ratio", "debt_to_equity",
+    "return_on_equity", "profit_margins", "revenue_growth", "earnings_growth"
+)
+
+def _sma(close: np.ndarray, window: int) -> float:
+    """Simple moving average of the last `window` closes (NaN if there are fewer)"""
+    if close.size < window:
+        return np.nan
+    return close[-window:].mean()
+
+def _rsi(close: np.ndarray, period: int = 14) -> float:
+    """RSI from the mean gain and loss over the last `period` price changes"""
+    if close.size < period:
+        return np.nan
+    # With exactly `period` closes the first change counts as 0, as pandas' diff() + where() does
+    window = close[-(period + 1):]
+    delta = np.diff(window, prepend=window[0])[-period:]
+    gain = np.where(delta > 0, delta, 0.0).mean()
+    loss = np.where(delta < 0, -delta, 0.0).mean()
+    # A zero loss gives RS = inf and RSI = 100, as with pandas
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 100 - (100 / (1 + gain / loss))
+
+def _macd(close: np.ndarray) -> Tuple[float, float]:
+    """Last MACD (EMA12 - EMA26) and signal (EMA9 of MACD) values, in one pass
+
+    Uses the same adjusted EWMA as pandas' ewm(span=...).mean(), carried as
+    running weighted sums so no intermediate series are built. A NaN close
+    only ages the earlier ones (pandas' ignore_na=False), so the MACD line
+    carries its last value through gaps.
+    """
+    decay_12, decay_26, decay_9 = 1 - 2 / 13, 1 - 2 / 27, 1 - 2 / 10
+    sum_12 = weight_12 = sum_26 = weight_26 = sum_9 = weight_9 = 0.0
+    macd = signal = np.nan
+    for value in close.tolist():
+        observed = value == value
+        value, weight = (value, 1.0) if observed else (0.0, 0.0)
+        sum_12 = value + decay_12 * sum_12
+        weight_12 = weight + decay_12 * weight_12
+        sum_26 = value + decay_26 * sum_26
+        weight_26 = weight + decay_26 * weight_26
+        if weight_12 == 0:
+            # No close seen yet, so the MACD line is still NaN
+            continue
+        macd = sum_12 / weight_12 - sum_26 / weight_26
+        sum_9 = macd + decay_9 * sum_9
+        weight_9 = 1 + decay_9 * weight_9
+        signal = sum_9 / weight_9
+    return macd, signal
+
+# Names of the _ti_kernel outputs, and the value reported when one cannot be computed
+_TI_NAMES = ("sma_20", "sma_50", "rsi", "macd", "macd_signal", "bb_upper", "bb_lower", "bb_middle")
+_TI_DEFAULTS = np.array([0.0, 0.0, 50.0, 0.0, 0.0, 0.0, 0.0, 0.0])
+
+def _ti_kernel(close: np.ndarray) -> Tuple[float, ...]:
+    """All eight technical indicators for a close-price array
+
+    Returns (sma_20, sma_50, rsi, macd, macd_signal, bb_upper, bb_lower,
+    bb_middle); values that need more history than is available are NaN.
+    """
+    sma_20 = _sma(close, 20)
+    sma_50 = _sma(close, 50)
+    rsi = _rsi(close, 14)
+    macd, signal = _macd(close)
+    # Bollinger Bands from the same 20-close window (sample std, as pandas rolling().std())
+    bb_std = close[-20:].std(ddof=1) if close.size >= 20 else np.nan
+    return sma_20, sma_50, rsi, macd, signal, sma_20 + 2 * bb_std, sma_20 - 2 * bb_std, sma_20
 
 class StockService:
     def __init__(self):
-        self.cache = {}
+        self.cache = TTLCache(maxsize=1024)
         self.cache_timeout = 300  # 5 minutes
+        self.analytics_cache_timeout = 300  # 5 minutes
+        # In-flight fetch per cache key, so concurrent misses for a symbol share one fetch
+        self._pending: Dict[str, asyncio.Task] = {}
+        # HTTP session shared by every yfinance call, set at app startup
+        self.session = None
+        # Optional Redis client shared by all workers as a second cache level, set at app startup
+        self.redis = None
+        # Caps concurrent quote fetches fanned out for a portfolio
+        self._portfolio_semaphore = asyncio.Semaphore(10)
+        # yf.download keeps its results in module globals, so run one at a time
+        self._download_lock = asyncio.Lock()
+        # Orders are inserted in batches by a background task
+        self.order_writer = WriteBehindQueue("orders")
+        # Quote snapshots are only an audit log, so they never hold up a quote
+        self.stock_writer = WriteBehindQueue("stocks", best_effort=True)
+        # How long execute_order waits for this worker's queued orders to be written
+        self.order_flush_timeout = 5.0
+        # Retries for an order another worker may not have written yet
+        self.order_lookup_attempts = 5
+        self.order_lookup_delay = 0.2
+
+    def _ticker(self, symbol: str) -> yf.Ticker:
+        """Build a Ticker bound to the shared HTTP session"""
+        return yf.Ticker(symbol, session=self.session)
+
+    async def _bulk_history(self, symbols: List[str], period: str) -> Dict[str, pd.DataFrame]:
+        """Download history for several symbols in one batch, keyed by symbol"""
+        async with self._download_lock:
+            data = await asyncio.get_running_loop().run_in_executor(_YF_POOL, partial(
+                yf.download,
+                symbols,
+                period=period,
+                group_by="ticker",
+                threads=True,
+                progress=False,
+                session=self.session
+            ))
+        if data is None or data.empty:
+            return {}
+
+        frames = {}
+        downloaded = set(data.columns.get_level_values(0))
+        for symbol in symbols:
+            if symbol not in downloaded:
+                continue
+            # Symbols that failed come back as all-NaN columns
+            frame = data[symbol].dropna(subset=["Close"])
+            if not frame.empty:
+                frames[symbol] = frame
+        return frames
+
+    async def _get_shared(self, cache_key: str, model, timeout: int):
+        """Read a cached model and its age in seconds from Redis (None if missing or Redis is unavailable)"""
+        if self.redis is None:
+            return None
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.get(f"tradebot:{cache_key}")
+                pipe.pttl(f"tradebot:{cache_key}")
+                raw, ttl_ms = await pipe.execute()
+        except Exception as e:
+            logger.warning("Failed to read %s from Redis: %s", cache_key, e)
+            return None
+        if raw is None or ttl_ms <= 0:
+            return None
+        return model.model_validate_json(raw), timeout - ttl_ms / 1000
+
+    async def _set_shared(self, cache_key: str, value, timeout: int):
+        """Write a model to Redis so other workers can reuse it until it expires"""
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(f"tradebot:{cache_key}", value.model_dump_json(), ex=timeout)
+        except Exception as e:
+            logger.warning("Failed to write %s to Redis: %s", cache_key, e)
+
+    async def _load(self, cache_key: str, model, timeout: int, fetch):
+        """Take a value another worker stored in Redis, else run fetch()"""
+        shared = await self._get_shared(cache_key, model, timeout)
+        if shared is not None:
+            cached, age = shared
+            # Expire locally when the Redis copy does, not a full period later
+            self.cache.set(cache_key, cached, age=age)
+            return cached
+        return await fetch()
+
+    async def _coalesce(self, cache_key: str, model, timeout: int, fetch):
+        """Load a cache miss, sharing one in-flight load among concurrent callers"""
+        task = self._pending.get(cache_key)
+        if task is None:
+            task = asyncio.create_task(self._load(cache_key, model, timeout, fetch))
+            self._pending[cache_key] = task
+            task.add_done_callback(partial(self._load_done, cache_key))
+        # A cancelled caller must not cancel the load the others are waiting on
+        return await asyncio.shield(task)
+
+    def _load_done(self, cache_key: str, task: asyncio.Task):
+        self._pending.pop(cache_key, None)
+        if not task.cancelled():
+            # Mark the exception retrieved in case every caller went away
+            task.exception()
+
+    async def invalidate(self, symbol: str):
+        """Drop cached quote and analytics for a symbol, locally and in Redis"""
+        symbol = symbol.strip().upper()
+        cache_keys = (f"stock_{symbol}", f"analytics_{symbol}")
+        for cache_key in cache_keys:
+            self.cache.pop(cache_key)
+        if self.redis is not None:
+            try:
+                await self.redis.delete(*(f"tradebot:{cache_key}" for cache_key in cache_keys))
+            except Exception as e:
+                logger.warning("Failed to delete %s from Redis: %s", symbol, e)
 
     async def get_stock_data(self, symbol: str) -> StockData:
         """Get comprehensive stock data including real-time price and metrics"""
@@ -19,59 +218,66 @@ class StockService:
             
             # Check cache first
             cache_key = f"stock_{symbol}"
-            if cache_key in self.cache:
-                cached_data, timestamp = self.cache[cache_key]
-                if (datetime.now(timezone.utc) - timestamp).seconds < self.cache_timeout:
-                    return cached_data
-
-            stock = yf.Ticker(symbol)
-            
-            # Get current data
-            hist = stock.history(period="2d")
-            if hist is None or hist.empty:
-                raise ValueError(f"No data found for symbol {symbol}")
-            
-            # Get additional info (yfinance can return None/empty)
-            info = stock.info or {}
-            
-            current_row = hist.iloc[-1]
-            previous_row = hist.iloc[-2] if len(hist) > 1 else current_row
-            
-            change = current_row["Close"] - previous_row["Close"]
-            change_percent = (change / previous_row["Close"]) * 100 if previous_row["Close"] != 0 else 0
-            
-            stock_data = StockData(
-                symbol=symbol,
-                price=float(current_row["Close"]),
-                volume=int(current_row["Volume"]),
-                open_price=float(current_row["Open"]),
-                high_price=float(current_row["High"]),
-                low_price=float(current_row["Low"]),
-                close_price=float(current_row["Close"]),
-                previous_close=float(previous_row["Close"]),
-                change=float(change),
-                change_percent=float(change_percent),
-                market_cap=info.get('marketCap'),
-                pe_ratio=info.get('trailingPE'),
-                dividend_yield=info.get('dividendYield'),
-                timestamp=datetime.now(timezone.utc)
-            )
-
-            # Cache the data
-            self.cache[cache_key] = (stock_data, datetime.now(timezone.utc))
-            
-            # Store in database
-            if db is not None:
-                try:
-                    await db.stocks.insert_one(stock_data.dict())
-                except Exception as e:
-                    print(f"Failed to store stock data: {e}")
+            cached_data = self.cache.get(cache_key, self.cache_timeout)
+            if cached_data is not None:
+                return cached_data
 
-            return stock_data
+            return await self._coalesce(cache_key, StockData, self.cache_timeout, partial(self._fetch_stock_data, symbol, cache_key))
 
         except Exception as e:
             raise Exception(f"Failed to get stock data: {str(e)}")
 
+    async def _load_history_and_info(self, symbol: str, period: str) -> Tuple[pd.DataFrame, dict]:
+        """Fetch price history and info for a symbol as two concurrent _YF_POOL jobs"""
+        stock = self._ticker(symbol)
+        loop = asyncio.get_running_loop()
+        hist, info = await asyncio.gather(
+            loop.run_in_executor(_YF_POOL, partial(stock.history, period=period)),
+            loop.run_in_executor(_YF_POOL, lambda: stock.info)
+        )
+        # yfinance can return None/empty info
+        return hist, info or {}
+
+    async def _fetch_stock_data(self, symbol: str, cache_key: str) -> StockData:
+        """Fetch a fresh quote from Yahoo Finance, then cache and store it"""
+        # Get current data and additional info off the event loop
+        hist, info = await self._load_history_and_info(symbol, "2d")
+        if hist is None or hist.empty:
+            raise ValueError(f"No data found for symbol {symbol}")
+        
+        current_row = hist.iloc[-1]
+        previous_row = hist.iloc[-2] if len(hist) > 1 else current_row
+        
+        change = current_row["Close"] - previous_row["Close"]
+        change_percent = (change / previous_row["Close"]) * 100 if previous_row["Close"] != 0 else 0
+        
+        stock_data = StockData(
+            symbol=symbol,
+            price=float(current_row["Close"]),
+            volume=int(current_row["Volume"]),
+            open_price=float(current_row["Open"]),
+            high_price=float(current_row["High"]),
+            low_price=float(current_row["Low"]),
+            close_price=float(current_row["Close"]),
+            previous_close=float(previous_row["Close"]),
+            change=float(change),
+            change_percent=float(change_percent),
+            market_cap=info.get('marketCap'),
+            pe_ratio=info.get('trailingPE'),
+            dividend_yield=info.get('dividendYield'),
+            timestamp=datetime.now(timezone.utc)
+        )
+
+        # Cache the data
+        self.cache.set(cache_key, stock_data)
+        await self._set_shared(cache_key, stock_data, self.cache_timeout)
+        
+        # Store in database (batched by the background writer)
+        if database.db is not None:
+            await self.stock_writer.put(stock_data.model_dump())
+
+        return stock_data
+
     async def place_order(self, order: StockOrder) -> StockOrder:
         """Place a buy or sell order"""
         try:
@@ -85,19 +291,24 @@ class StockService:
             current_data = await self.get_stock_data(order.symbol)
             
             # Update order with current timestamp and calculated total
-            order.timestamp = datetime.now(timezone.utc)
+            now = datetime.now(timezone.utc)
+            order.timestamp = now
             order.total_amount = order.quantity * order.price
             
             # Store order in database
-            if db is not None:
-                result = await db.orders.insert_one(order.dict())
-                order.id = str(result.inserted_id)
+            if database.db is not None:
+                # Generate the id here so the order can be returned before it is written
+                object_id = ObjectId()
+                order.id = str(object_id)
+                await self.order_writer.put({**order.model_dump(), "_id": object_id})
                 
                 # Update portfolio if order is executed
                 if order.status == OrderStatus.EXECUTED:
                     await self._update_portfolio(order)
+                    # Quote the symbol afresh after a fill rather than from before it
+                    await self.invalidate(order.symbol)
             else:
-                order.id = f"order_{datetime.now().timestamp()}"
+                order.id = f"order_{now.timestamp()}"
 
             return order
 
@@ -107,32 +318,42 @@ class StockService:
     async def execute_order(self, order_id: str) -> StockOrder:
         """Execute a pending order"""
         try:
-            if db is None:
+            if database.db is None:
+                raise Exception("Database not available")
+
+            # A recently placed order may still be waiting in this worker's write-behind queue
+            try:
+                await asyncio.wait_for(self.order_writer.flush(), timeout=self.order_flush_timeout)
+            except asyncio.TimeoutError:
                 raise Exception("Database not available")
 
             # Convert string ID to ObjectId for MongoDB query
-            from bson import ObjectId
             try:
                 object_id = ObjectId(order_id)
             except:
                 # If not a valid ObjectId, try finding by string id field
-                order_doc = await db.orders.find_one({"id": order_id})
+                order_doc = await database.db.orders.find_one({"id": order_id})
                 if order_doc:
                     object_id = order_doc["_id"]
                 else:
                     raise Exception("Invalid order ID format")
 
-            # Find and update order
-            result = await db.orders.update_one(
-                {"_id": object_id},
-                {"$set": {"status": OrderStatus.EXECUTED}}
-            )
+            # Find and update order. An order placed on another worker can still be
+            # in that worker's queue for a moment, so retry briefly before giving up
+            for attempt in range(self.order_lookup_attempts):
+                result = await database.db.orders.update_one(
+                    {"_id": object_id},
+                    {"$set": {"status": OrderStatus.EXECUTED}}
+                )
+                if result.matched_count or attempt == self.order_lookup_attempts - 1:
+                    break
+                await asyncio.sleep(self.order_lookup_delay)
             
             if result.modified_count == 0:
                 raise Exception("Order not found or already executed")
 
             # Get updated order
-            order_doc = await db.orders.find_one({"_id": object_id})
+            order_doc = await database.db.orders.find_one({"_id": object_id})
             if not order_doc:
                 raise Exception("Order not found after execution")
             
@@ -143,6 +364,7 @@ class StockService:
             
             # Update portfolio
             await self._update_portfolio(order)
+            await self.invalidate(order.symbol)
             
             return order
 
@@ -152,20 +374,53 @@ class StockService:
     async def get_portfolio(self, user_id: str) -> List[Portfolio]:
         """Get user's portfolio"""
         try:
-            if db is None:
+            if database.db is None:
                 return []
 
-            portfolio_docs = await db.portfolio.find({"user_id": user_id}).to_list(None)
+            portfolio_docs = await database.db.portfolio.find({"user_id": user_id}).to_list(None)
             portfolios = []
             
+            # Use cached quotes where fresh, then download the rest in one batch
+            prices = {}
+            missing = []
+            for symbol in {doc["symbol"] for doc in portfolio_docs}:
+                cached_data = self.cache.get(f"stock_{symbol}", self.cache_timeout)
+                if cached_data is not None:
+                    prices[symbol] = cached_data.price
+                else:
+                    missing.append(symbol)
+
+            if missing:
+                try:
+                    frames = await self._bulk_history(missing, "2d")
+                except Exception as e:
+                    logger.warning("Batch download failed for %s: %s", missing, e)
+                    frames = {}
+                for symbol, frame in frames.items():
+                    prices[symbol] = float(frame["Close"].iloc[-1])
+
+            # Fall back to per-symbol quotes for anything the batch did not return
+            async def fetch_quote(symbol):
+                async with self._portfolio_semaphore:
+                    return await self.get_stock_data(symbol)
+
+            fallback = [symbol for symbol in missing if symbol not in prices]
+            results = await asyncio.gather(*(fetch_quote(symbol) for symbol in fallback), return_exceptions=True)
+            for symbol, result in zip(fallback, results):
+                prices[symbol] = result if isinstance(result, Exception) else result.price
+            
+            now = datetime.now(timezone.utc)
             for doc in portfolio_docs:
-                # Get current stock data to update values
+                # Update values from the fetched price
                 try:
-                    current_data = await self.get_stock_data(doc["symbol"])
-                    current_value = doc["quantity"] * current_data.price
+                    current_price = prices[doc["symbol"]]
+                    if isinstance(current_price, Exception):
+                        raise current_price
+                    current_value = doc["quantity"] * current_price
                     unrealized_pnl = current_value - doc["total_invested"]
                     
-                    portfolio = Portfolio(
+                    # Fields come from our own documents, so skip re-validating them
+                    portfolio = Portfolio.model_construct(
                         user_id=doc["user_id"],
                         symbol=doc["symbol"],
                         quantity=doc["quantity"],
@@ -173,11 +428,29 @@ class StockService:
                         total_invested=doc["total_invested"],
                         current_value=current_value,
                         unrealized_pnl=unrealized_pnl,
-                        last_updated=datetime.now(timezone.utc)
+                        last_updated=now
                     )
                     portfolios.append(portfolio)
                 except Exception as e:
-                    print(f"Failed to update portfolio for {doc['symbol']}: {e}")
+                    logger.warning("Failed to update portfolio for %s: %s", doc["symbol"], e)
+
+            # Persist the refreshed values for every position in one round-trip
+            if portfolios:
+                updates = [
+                    UpdateOne(
+                        {"user_id": portfolio.user_id, "symbol": portfolio.symbol},
+                        {"$set": {
+                            "current_value": portfolio.current_value,
+                            "unrealized_pnl": portfolio.unrealized_pnl,
+                            "last_updated": now
+                        }}
+                    )
+                    for portfolio in portfolios
+                ]
+                try:
+                    await database.db.portfolio.bulk_write(updates, ordered=False)
+                except Exception as e:
+                    logger.warning("Failed to store portfolio values: %s", e)
 
             return portfolios
 
@@ -187,99 +460,78 @@ class StockService:
     async def get_stock_analytics(self, symbol: str) -> StockAnalytics:
         """Get comprehensive stock analytics including technical indicators"""
         try:
-            stock = yf.Ticker(symbol)
-            
-            # Get historical data
-            hist = stock.history(period="1y")
-            if hist.empty:
-                raise ValueError(f"No historical data for {symbol}")
+            symbol = symbol.strip().upper()
 
-            # Calculate technical indicators
-            technical_indicators = self._calculate_technical_indicators(hist)
-            
-            # Get fundamental metrics
-            info = stock.info
-            fundamental_metrics = {
-                "market_cap": info.get('marketCap'),
-                "pe_ratio": info.get('trailingPE'),
-                "pb_ratio": info.get('priceToBook'),
-                "debt_to_equity": info.get('debtToEquity'),
-                "return_on_equity": info.get('returnOnEquity'),
-                "profit_margins": info.get('profitMargins'),
-                "revenue_growth": info.get('revenueGrowth'),
-                "earnings_growth": info.get('earningsGrowth')
-            }
+            cache_key = f"analytics_{symbol}"
+            cached_analytics = self.cache.get(cache_key, self.analytics_cache_timeout)
+            if cached_analytics is not None:
+                return cached_analytics
 
-            # Generate price history
-            price_history = []
-            for date, row in hist.tail(30).iterrows():  # Last 30 days
-                price_history.append({
-                    "date": date.strftime("%Y-%m-%d"),
-                    "close": float(row["Close"]),
-                    "volume": int(row["Volume"])
-                })
-
-            # Generate recommendations
-            recommendations = self._generate_recommendations(technical_indicators, fundamental_metrics)
-            
-            # Calculate risk score
-            risk_score = self._calculate_risk_score(technical_indicators, fundamental_metrics)
-
-            analytics = StockAnalytics(
-                symbol=symbol,
-                technical_indicators=technical_indicators,
-                fundamental_metrics=fundamental_metrics,
-                price_history=price_history,
-                recommendations=recommendations,
-                risk_score=risk_score,
-                timestamp=datetime.now(timezone.utc)
-            )
-
-            return analytics
+            return await self._coalesce(cache_key, StockAnalytics, self.analytics_cache_timeout, partial(self._fetch_stock_analytics, symbol, cache_key))
 
         except Exception as e:
             raise Exception(f"Failed to get analytics: {str(e)}")
 
-    def _calculate_technical_indicators(self, hist: pd.DataFrame) -> Dict[str, float]:
-        """Calculate technical indicators from historical data"""
+    async def _fetch_stock_analytics(self, symbol: str, cache_key: str) -> StockAnalytics:
+        """Fetch a year of history and fundamentals, then compute and cache analytics"""
+        # Get historical data and info off the event loop
+        hist, info = await self._load_history_and_info(symbol, "1y")
+        if hist is None or hist.empty:
+            raise ValueError(f"No historical data for {symbol}")
+        # Only Close and Volume are read, straight from their columns: narrowing the
+        # frame first would copy it, and float32/int32 would lose EMA precision and
+        # overflow on large volumes. Indicators and price history share one float64
+        # copy of the closes
+        close = np.ascontiguousarray(hist["Close"].to_numpy(), dtype=np.float64)
+
+        # Calculate technical indicators
+        technical_indicators = self._calculate_technical_indicators(close)
+        
+        # Get fundamental metrics
+        fundamental_metrics = dict(zip(_METRIC_NAMES, map(info.get, _INFO_FIELDS)))
+
+        # Generate price history (last 30 days)
+        price_history = [
+            {"date": date, "close": price, "volume": volume}
+            for date, price, volume in zip(
+                hist.index[-30:].strftime("%Y-%m-%d").tolist(),
+                close[-30:].tolist(),
+                hist["Volume"].iloc[-30:].to_numpy(dtype=np.int64).tolist()
+            )
+        ]
+
+        # Generate recommendations
+        recommendations = self._generate_recommendations(technical_indicators, fundamental_metrics)
+        
+        # Calculate risk score
+        risk_score = self._calculate_risk_score(technical_indicators, fundamental_metrics)
+
+        analytics = StockAnalytics(
+            symbol=symbol,
+            technical_indicators=technical_indicators,
+            fundamental_metrics=fundamental_metrics,
+            price_history=price_history,
+            recommendations=recommendations,
+            risk_score=risk_score,
+            timestamp=datetime.now(timezone.utc)
+        )
+
+        self.cache.set(cache_key, analytics)
+        await self._set_shared(cache_key, analytics, self.analytics_cache_timeout)
+
+        return analytics
+
+    def _calculate_technical_indicators(self, close: np.ndarray) -> Dict[str, float]:
+        """Calculate technical indicators from a float64 array of closing prices"""
         try:
-            close_prices = hist['Close']
-            
-            # Moving averages
-            sma_20 = close_prices.rolling(window=20).mean().iloc[-1]
-            sma_50 = close_prices.rolling(window=50).mean().iloc[-1]
+            raw = np.array(_ti_kernel(close), dtype=np.float64)
             
-            # RSI
-            delta = close_prices.diff()
-            gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-            loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-            rs = gain / loss
-            rsi = 100 - (100 / (1 + rs.iloc[-1]))
-            
-            # MACD
-            ema_12 = close_prices.ewm(span=12).mean()
-            ema_26 = close_prices.ewm(span=26).mean()
-            macd = ema_12.iloc[-1] - ema_26.iloc[-1]
-            signal = (ema_12 - ema_26).ewm(span=9).mean().iloc[-1]
-            
-            # Bollinger Bands
-            bb_20 = close_prices.rolling(window=20).mean().iloc[-1]
-            bb_std = close_prices.rolling(window=20).std().iloc[-1]
-            bb_upper = bb_20 + (bb_std * 2)
-            bb_lower = bb_20 - (bb_std * 2)
-            
-            return {
-                "sma_20": float(sma_20) if not pd.isna(sma_20) else 0,
-                "sma_50": float(sma_50) if not pd.isna(sma_50) else 0,
-                "rsi": float(rsi) if not pd.isna(rsi) else 50,
-                "macd": float(macd) if not pd.isna(macd) else 0,
-                "macd_signal": float(signal) if not pd.isna(signal) else 0,
-                "bb_upper": float(bb_upper) if not pd.isna(bb_upper) else 0,
-                "bb_lower": float(bb_lower) if not pd.isna(bb_lower) else 0,
-                "bb_middle": float(bb_20) if not pd.isna(bb_20) else 0
-            }
+            # Replace indicators that need more history than we have with their defaults
+            missing = np.isnan(raw)
+            raw[missing] = _TI_DEFAULTS[missing]
+            return dict(zip(_TI_NAMES, raw.tolist()))
         except Exception as e:
-            print(f"Error calculating technical indicators: {e}")
+            logger.warning("Error calculating technical indicators: %s", e)
             return {}
 
     def _generate_recommendations(self, technical: Dict, fundamental: Dict) -> List[str]:
@@ -345,73 +597,59 @@ class StockService:
     async def _update_portfolio(self, order: StockOrder):
         """Update portfolio after order execution"""
         try:
-            if db is None:
+            if database.db is None:
                 return
 
+            now = datetime.now(timezone.utc)
             portfolio_filter = {"user_id": order.user_id, "symbol": order.symbol}
-            existing_portfolio = await db.portfolio.find_one(portfolio_filter)
             
             if order.order_type == OrderType.BUY:
-                if existing_portfolio:
-                    # Update existing position
-                    new_quantity = existing_portfolio["quantity"] + order.quantity
-                    new_total_invested = existing_portfolio["total_invested"] + order.total_amount
-                    new_average_price = new_total_invested / new_quantity
-                    
-                    await db.portfolio.update_one(
-                        portfolio_filter,
-                        {
-                            "$set": {
-                                "quantity": new_quantity,
-                                "average_price": new_average_price,
-                                "total_invested": new_total_invested,
-                                "last_updated": datetime.now(timezone.utc)
-                            }
-                        }
-                    )
-                else:
-                    # Create new position
-                    portfolio = Portfolio(
-                        user_id=order.user_id,
-                        symbol=order.symbol,
-                        quantity=order.quantity,
-                        average_price=order.price,
-                        total_invested=order.total_amount,
-                        current_value=order.total_amount,
-                        unrealized_pnl=0,
-                        last_updated=datetime.now(timezone.utc)
-                    )
-                    await db.portfolio.insert_one(portfolio.dict())
+                # Add to the position, creating it if needed, and recompute the
+                # average price in one atomic update
+                new_quantity = {"$add": [{"$ifNull": ["$quantity", 0]}, order.quantity]}
+                new_total_invested = {"$add": [{"$ifNull": ["$total_invested", 0]}, order.total_amount]}
+                await database.db.portfolio.update_one(
+                    portfolio_filter,
+                    [
+                        {"$set": {
+                            "quantity": new_quantity,
+                            "total_invested": new_total_invested,
+                            "average_price": {"$divide": [new_total_invested, new_quantity]},
+                            "current_value": {"$ifNull": ["$current_value", order.total_amount]},
+                            "unrealized_pnl": {"$ifNull": ["$unrealized_pnl", 0]},
+                            "last_updated": now
+                        }}
+                    ],
+                    upsert=True
+                )
             
             elif order.order_type == OrderType.SELL:
-                if existing_portfolio and existing_portfolio["quantity"] >= order.quantity:
-                    # Update existing position
-                    remaining_quantity = existing_portfolio["quantity"] - order.quantity
-                    sold_ratio = order.quantity / existing_portfolio["quantity"]
-                    sold_investment = existing_portfolio["total_invested"] * sold_ratio
-                    
-                    if remaining_quantity > 0:
-                        # Partial sell
-                        new_total_invested = existing_portfolio["total_invested"] - sold_investment
-                        new_average_price = new_total_invested / remaining_quantity
-                        
-                        await db.portfolio.update_one(
-                            portfolio_filter,
-                            {
-                                "$set": {
-                                    "quantity": remaining_quantity,
-                                    "average_price": new_average_price,
-                                    "total_invested": new_total_invested,
-                                    "last_updated": datetime.now(timezone.utc)
-                                }
-                            }
-                        )
-                    else:
-                        # Full sell - remove position
-                        await db.portfolio.delete_one(portfolio_filter)
+                # Reduce the position only if it holds enough shares. Selling at the
+                # average cost leaves the average price unchanged; it is taken from
+                # the stored totals rather than trusted from average_price
+                average_cost = {"$divide": ["$total_invested", "$quantity"]}
+                position = await database.db.portfolio.find_one_and_update(
+                    {**portfolio_filter, "quantity": {"$gte": order.quantity}},
+                    [
+                        {"$set": {
+                            "total_invested": {"$subtract": [
+                                "$total_invested",
+                                {"$multiply": [average_cost, order.quantity]}
+                            ]},
+                            "quantity": {"$subtract": ["$quantity", order.quantity]},
+                            "average_price": average_cost,
+                            "last_updated": now
+                        }}
+                    ],
+                    return_document=ReturnDocument.AFTER
+                )
+                
+                if position is not None and position["quantity"] == 0:
+                    # Full sell - remove position
+                    await database.db.portfolio.delete_one({"_id": position["_id"], "quantity": 0})
 
         except Exception as e:
-            print(f"Failed to update portfolio: {e}")
+            logger.warning("Failed to update portfolio: %s", e)
 
     async def get_best_market_opportunity(self) -> dict:
         """Analyze popular stocks and recommend the best one to buy right now"""
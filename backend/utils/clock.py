@@ -0,0 +1,18 @@
+import asyncio
+from datetime import datetime, timezone
+
+def _format_now() -> str:
+    return datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+
+_now_iso = _format_now()
+
+def now_iso() -> str:
+    """Current UTC time as a second-resolution ISO string, refreshed by tick()"""
+    return _now_iso
+
+async def tick(interval: float = 0.2):
+    """Refresh the cached timestamp every `interval` seconds"""
+    global _now_iso
+    while True:
+        _now_iso = _format_now()
+        await asyncio.sleep(interval)
@@ -0,0 +1,30 @@
+import logging
+import logging.handlers
+import queue
+from typing import Optional
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[logging.handlers.QueueHandler] = None
+
+def start():
+    """Route log records through a queue so only a background thread writes to the stream"""
+    global _listener, _handler
+    if _listener is not None:
+        return
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _handler = logging.handlers.QueueHandler(log_queue)
+    logging.getLogger().addHandler(_handler)
+    _listener.start()
+
+def stop():
+    """Flush queued records and stop the background thread"""
+    global _listener, _handler
+    if _listener is None:
+        return
+    logging.getLogger().removeHandler(_handler)
+    _listener.stop()
+    _listener = None
+    _handler = None
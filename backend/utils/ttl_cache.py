@@ -0,0 +1,36 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+class TTLCache:
+    """Bounded LRU cache whose entries expire after a per-lookup timeout"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    def get(self, key: Hashable, timeout: float) -> Optional[Any]:
+        """Return the value for a key if it was set less than `timeout` seconds ago, else None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        if time.monotonic() - stored_at >= timeout:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, age: float = 0.0):
+        """Store a value that is already `age` seconds old, evicting the least recently used entry when full"""
+        self._entries[key] = (value, time.monotonic() - age)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        """Remove a key if present"""
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
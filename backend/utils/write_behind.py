@@ -0,0 +1,123 @@
+import asyncio
+import logging
+from typing import Optional
+from pymongo.errors import BulkWriteError
+import database
+
+logger = logging.getLogger("write_behind")
+
+# Queued by close() to tell the drain task to finish
+_STOP = object()
+
+# Duplicate key: the document was already stored by an earlier attempt
+_DUPLICATE_KEY = 11000
+
+# Attempts per batch before a best-effort queue gives up on it
+_BEST_EFFORT_ATTEMPTS = 3
+
+class WriteBehindQueue:
+    """Buffer documents for a MongoDB collection and insert them in batches off the request path
+
+    A best-effort queue never makes callers wait: documents are dropped when
+    the buffer is full or a batch still fails after a few attempts.
+    """
+
+    def __init__(self, collection: str, maxsize: int = 10_000, batch_size: int = 200,
+                 retry_delay: float = 0.5, max_retry_delay: float = 10.0, best_effort: bool = False):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.best_effort = best_effort
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def start(self):
+        """Start the background task that drains the queue"""
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Write everything still queued and stop the drain task"""
+        if self._task is None:
+            return
+        # Stop retrying failed batches forever once shutdown has begun
+        self._closing = True
+        await self.queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def flush(self):
+        """Wait until every document queued so far has been written (or given up on)"""
+        if self._task is not None:
+            await self.queue.join()
+
+    async def put(self, document: dict):
+        """Queue a document for insertion, waiting if the buffer is full (dropping it if best-effort)"""
+        if self._task is None:
+            # Nothing is draining the queue (e.g. outside the app), write now
+            await self._write([document])
+            return
+        if not self.best_effort:
+            await self.queue.put(document)
+            return
+        try:
+            self.queue.put_nowait(document)
+        except asyncio.QueueFull:
+            logger.warning("Write-behind queue for %s is full, dropping a document", self.collection)
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            documents = [doc for doc in batch if doc is not _STOP]
+            try:
+                if documents:
+                    await self._write(documents)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if len(documents) != len(batch):
+                return
+
+    async def _write(self, documents: list):
+        """Insert a batch, retrying with backoff while the database is unreachable"""
+        delay = self.retry_delay
+        attempts = 0
+        while database.db is not None:
+            attempts += 1
+            try:
+                # insert_many sets _id on each dict, so a retried document keeps its id
+                await database.db[self.collection].insert_many(documents, ordered=False)
+                return
+            except BulkWriteError as e:
+                # Documents rejected by the server will not succeed on retry
+                rejected = [
+                    error for error in e.details.get("writeErrors", [])
+                    if error.get("code") != _DUPLICATE_KEY
+                ]
+                if rejected:
+                    logger.error(
+                        "Dropped %d documents rejected by %s: %s",
+                        len(rejected), self.collection,
+                        [(documents[error["index"]].get("_id"), error.get("errmsg")) for error in rejected]
+                    )
+                return
+            except Exception as e:
+                gave_up = self.best_effort and attempts >= _BEST_EFFORT_ATTEMPTS
+                if self._task is None or self._closing or gave_up:
+                    logger.error(
+                        "Dropped %d documents for %s after write failure: %s (ids: %s)",
+                        len(documents), self.collection, e, [doc.get("_id") for doc in documents]
+                    )
+                    return
+                logger.warning(
+                    "Failed to write %d documents to %s, retrying in %.1fs: %s",
+                    len(documents), self.collection, delay, e
+                )
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_retry_delay)